@@ -1,19 +1,40 @@
 import os
+import sys
+import traceback
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 
+RED = '\033[91m'
+GREEN = '\033[92m'
+RESET = '\033[0m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+ORANGE = '\033[38;5;208m'
+
+_SEPARATOR = "-" * 30 + "\n"
+
+# Colored status text for active states (other states are shown as-is)
+_STATE_DISPLAY = {
+    types.JobState.JOB_STATE_RUNNING: f"{GREEN}JOB_STATE_RUNNING{RESET}",
+    types.JobState.JOB_STATE_PENDING: f"{ORANGE}JOB_STATE_PENDING{RESET}",
+    types.JobState.JOB_STATE_QUEUED: f"{ORANGE}JOB_STATE_QUEUED{RESET}",
+}
+
+# Job states listed under ACTIVE JOBS
+ACTIVE_STATES = frozenset({
+    types.JobState.JOB_STATE_PENDING,
+    types.JobState.JOB_STATE_QUEUED,
+    types.JobState.JOB_STATE_RUNNING,
+    types.JobState.JOB_STATE_UPDATING,
+    types.JobState.JOB_STATE_PAUSED,
+    types.JobState.JOB_STATE_CANCELLING,
+})
+
 def check_jobs():
     # Load environment variables
     load_dotenv()
     
-    RED = '\033[91m'
-    GREEN = '\033[92m'
-    RESET = '\033[0m'
-    YELLOW = '\033[93m'
-    BLUE = '\033[94m'
-    ORANGE = '\033[38;5;208m'
-    
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         print("Error: GEMINI_API_KEY not found in environment variables.")
@@ -36,61 +57,52 @@ def check_jobs():
             print("No batch jobs found (active or history).")
             return
 
-        # Filter for active jobs
-        active_states = [
-            "JOB_STATE_PENDING", 
-            "JOB_STATE_QUEUED", 
-            "JOB_STATE_RUNNING", 
-            "JOB_STATE_UPDATING",
-            "JOB_STATE_PAUSED",
-            "JOB_STATE_CANCELLING"
-        ]
-        
-        active_jobs = [j for j in jobs if j.state in active_states]
-        completed_jobs = [j for j in jobs if j.state not in active_states]
+        # Split into active / completed in a single pass
+        active_jobs, completed_jobs = [], []
+        for j in jobs:
+            (active_jobs if j.state in ACTIVE_STATES else completed_jobs).append(j)
 
         print(f"\nSummary: {GREEN}{len(active_jobs)} active{RESET}, {len(completed_jobs)} completed/failed.")
         
         if active_jobs:
             print(f"\n=== {GREEN}ACTIVE JOBS{RESET} ===")
             for job in active_jobs:
-                print(f"Job ID: {job.name}")
-                if hasattr(job, 'display_name') and job.display_name:
-                    print(f"Name: {BLUE}{job.display_name}{RESET}")
+                display_name = getattr(job, 'display_name', None)
+                # Build each job's block and write it in one call
+                out = [f"Job ID: {job.name}\n"]
+                if display_name:
+                    out.append(f"Name: {BLUE}{display_name}{RESET}\n")
                 
-                # Determine state color
-                state_str = str(job.state)
-                if state_str == "JOB_STATE_RUNNING":
-                     state_display = f"{GREEN}{state_str}{RESET}"
-                elif state_str in ["JOB_STATE_PENDING", "JOB_STATE_QUEUED"]:
-                     state_display = f"{ORANGE}{state_str}{RESET}"
-                else:
-                     state_display = state_str
-                     
-                print(f"Status: {state_display}")
-                print(f"Created: {job.create_time}")
-                print("-" * 30)
+                out.append(f"Status: {_STATE_DISPLAY.get(job.state, job.state)}\n")
+                out.append(f"Created: {job.create_time}\n")
+                out.append(_SEPARATOR)
+                sys.stdout.write("".join(out))
         else:
             print("\nNo active (running/pending) jobs.")
 
         if completed_jobs:
             print(f"\n=== {RED}RECENT HISTORY (Last 5){RESET} ===")
-            # Sort by create_time descending just in case
-            completed_jobs.sort(key=lambda x: str(x.create_time), reverse=True)
+            # Sort by create_time descending just in case (datetimes compare chronologically);
+            # create_time is optional, so jobs without one go last instead of breaking the sort
+            completed_jobs.sort(
+                key=lambda j: (j.create_time is not None, j.create_time), reverse=True
+            )
             
             for job in completed_jobs[:5]:
-                print(f"Job ID: {job.name}")
-                if hasattr(job, 'display_name') and job.display_name:
-                    print(f"Name: {job.display_name}")
-                print(f"Status: {job.state}")
-                print(f"Created: {job.create_time}")
-                if hasattr(job, 'error') and job.error:
-                     print(f"Error: {job.error}")
-                print("-" * 30)
+                display_name = getattr(job, 'display_name', None)
+                error = getattr(job, 'error', None)
+                out = [f"Job ID: {job.name}\n"]
+                if display_name:
+                    out.append(f"Name: {display_name}\n")
+                out.append(f"Status: {job.state}\n")
+                out.append(f"Created: {job.create_time}\n")
+                if error:
+                     out.append(f"Error: {error}\n")
+                out.append(_SEPARATOR)
+                sys.stdout.write("".join(out))
 
     except Exception as e:
         print(f"An error occurred: {e}")
-        import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
@@ -1,16 +1,18 @@
 import os
+import sys
+import traceback
 from google import genai
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
 def format_size(size_bytes):
     if not size_bytes:
         return "0 B"
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.2f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.2f} TB"
+    # Each unit is 2**10 of the previous one, so the bit length picks it directly
+    i = min((int(size_bytes).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (i * 10)):.2f} {_SIZE_UNITS[i]}"
 
 def check_storage():
     load_dotenv()
@@ -38,8 +40,10 @@ def check_storage():
         print(f"{'Display Name':<30} | {'Size':<10} | {'State':<10} | {'Expires In'}")
         print("-" * 60)
 
-        now = datetime.now(timezone.utc)
+        now_ts = datetime.now(timezone.utc).timestamp()
 
+        # Collect table rows and write them in one call
+        rows = []
         for f in files:
             size = f.size_bytes or 0
             total_size += size
@@ -48,16 +52,16 @@ def check_storage():
             # Calculate time until expiration
             expires_in = "N/A"
             if f.expiration_time:
-                # Ensure we handle timezone aware datetimes
+                # The API returns UTC-aware datetimes; a naive one would be read as
+                # local time by .timestamp(), so pin it to UTC just in case
                 exp_time = f.expiration_time
                 if exp_time.tzinfo is None:
                     exp_time = exp_time.replace(tzinfo=timezone.utc)
                 
-                delta = exp_time - now
-                if delta.total_seconds() > 0:
-                    hours = int(delta.total_seconds() // 3600)
-                    minutes = int((delta.total_seconds() % 3600) // 60)
-                    expires_in = f"{hours}h {minutes}m"
+                secs = int(exp_time.timestamp() - now_ts)
+                if secs > 0:
+                    hours, rem = divmod(secs, 3600)
+                    expires_in = f"{hours}h {rem // 60}m"
                 else:
                     expires_in = "Expired"
 
@@ -66,8 +70,9 @@ def check_storage():
             if len(name) > 28:
                 name = name[:25] + "..."
                 
-            print(f"{name:<30} | {format_size(size):<10} | {f.state.name if f.state else 'UNKNOWN':<10} | {expires_in}")
+            rows.append(f"{name:<30} | {format_size(size):<10} | {f.state.name if f.state else 'UNKNOWN':<10} | {expires_in}\n")
 
+        sys.stdout.write("".join(rows))
         print("-" * 60)
         print(f"Total Files: {active_files}")
         print(f"Total Storage Used: {format_size(total_size)}")
@@ -75,7 +80,6 @@ def check_storage():
 
     except Exception as e:
         print(f"An error occurred: {e}")
-        import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
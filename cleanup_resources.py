@@ -1,9 +1,132 @@
 import os
 import time
+import asyncio
+import importlib.util
 from google import genai
+from google.genai import types
 from google.genai.types import JobState
 from dotenv import load_dotenv
 
+# Number of cancel/delete requests kept in flight at once
+MAX_CONCURRENCY = 32
+
+# Job states that still need a cancel request
+CANCELLABLE_STATES = frozenset({
+    JobState.JOB_STATE_QUEUED,
+    JobState.JOB_STATE_PENDING,
+    JobState.JOB_STATE_RUNNING,
+    JobState.JOB_STATE_PARTIALLY_SUCCEEDED,
+})
+
+# One event loop for the whole run: the SDK's async HTTP client keeps pooled
+# connections bound to the loop that opened them
+_loop = None
+
+
+def _run(coro):
+    """Run a coroutine on the shared event loop."""
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def _close_loop(client) -> None:
+    """Close the client's async transport (if this SDK version can) and then the shared loop."""
+    global _loop
+    if _loop is None:
+        return
+    aclose = getattr(client.aio, "aclose", None)
+    try:
+        if aclose is not None:
+            _loop.run_until_complete(aclose())
+        _loop.run_until_complete(_loop.shutdown_asyncgens())
+    except Exception:
+        pass
+    finally:
+        _loop.close()
+        _loop = None
+
+
+def _http_options():
+    """HTTP options for the client: multiplex the concurrent async calls over HTTP/2 when possible.
+
+    httpx only speaks HTTP/2 with the optional `h2` package, and the SDK switches its async
+    transport to aiohttp when that is installed, so only opt in for plain httpx + h2.
+    """
+    if importlib.util.find_spec("h2") is None or importlib.util.find_spec("aiohttp") is not None:
+        return None
+    return types.HttpOptions(async_client_args={"http2": True})
+
+
+async def _cancel_one(client, job):
+    """Send a cancel request for a single job. Returns (success, log lines)."""
+    lines = [f"Cancelling job {job.name} (Status: {job.state})..."]
+    try:
+        await client.aio.batches.cancel(name=job.name)
+        lines.append(f"  > Cancel request sent for {job.name}")
+        return True, lines
+    except Exception as e:
+        lines.append(f"  > Failed to cancel {job.name}: {e}")
+        return False, lines
+
+
+async def _delete_job(client, job):
+    """Delete a single job record. Returns (success, log lines)."""
+    lines = [f"Deleting job record: {job.name} ({job.state})"]
+    try:
+        await client.aio.batches.delete(name=job.name)
+        lines.append("  > Deleted.")
+        return True, lines
+    except Exception as e:
+        lines.append(f"  > Failed to delete: {e}")
+        return False, lines
+
+
+async def _delete_file(client, target):
+    """Delete a single uploaded file given (name, display_name). Returns (success, log lines)."""
+    name, display_name = target
+    lines = [f"Deleting file: {name} (Display Name: {display_name})"]
+    try:
+        await client.aio.files.delete(name=name)
+        lines.append("  > Deleted.")
+        return True, lines
+    except Exception as e:
+        lines.append(f"  > Failed to delete {name}: {e}")
+        return False, lines
+
+
+async def _refresh_job(client, job):
+    """Re-fetch a single job (e.g. after cancelling it); falls back to the cached object on error."""
+    try:
+        return await client.aio.batches.get(name=job.name)
+    except Exception:
+        return job
+
+
+async def _gather_bounded(fn, client, items) -> list:
+    """await fn(client, item) for all items, at most MAX_CONCURRENCY at a time; results keep input order."""
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def _one(item):
+        async with sem:
+            return await fn(client, item)
+
+    return await asyncio.gather(*(_one(item) for item in items))
+
+
+def _run_concurrently(fn, client, items) -> int:
+    """Run fn(client, item) for all items concurrently; print logs in input order. Returns success count."""
+    if not items:
+        return 0
+    succeeded = 0
+    # Print after gathering so output of different requests never interleaves
+    for ok, lines in _run(_gather_bounded(fn, client, items)):
+        print("\n".join(lines))
+        succeeded += ok
+    return succeeded
+
+
 def cleanup_resources():
     load_dotenv()
     api_key = os.getenv("GEMINI_API_KEY")
@@ -11,119 +134,106 @@ def cleanup_resources():
         print("Error: GEMINI_API_KEY not found.")
         return
 
-    client = genai.Client(api_key=api_key)
+    # Single client for the whole run: all calls share its connection pool
+    client = genai.Client(api_key=api_key, http_options=_http_options())
 
-    # 1. Stop/Cancel Running Jobs
-    print("--- Checking for active jobs to stop ---")
     try:
-        # Get all jobs
-        jobs = list(client.batches.list())
-        
-        active_states = [
-            "JOB_STATE_QUEUED", 
-            "JOB_STATE_PENDING", 
-            "JOB_STATE_RUNNING",
-            "JOB_STATE_PARTIALLY_SUCCEEDED"
-        ]
+        # Job list is fetched once and reused by the history cleanup below
+        jobs = None
+
+        # 1. Stop/Cancel Running Jobs
+        print("--- Checking for active jobs to stop ---")
+        try:
+            # Get all jobs
+            jobs = list(client.batches.list())
         
-        active_jobs_count = 0
-        for job in jobs:
-            state_str = str(job.state)
-            if state_str in active_states:
-                print(f"Cancelling job {job.name} (Status: {state_str})...")
-                try:
-                    client.batches.cancel(name=job.name)
-                    print(f"  > Cancel request sent for {job.name}")
-                    active_jobs_count += 1
-                except Exception as e:
-                    print(f"  > Failed to cancel {job.name}: {e}")
+            to_cancel = [j for j in jobs if j.state in CANCELLABLE_STATES]
+            active_jobs_count = _run_concurrently(_cancel_one, client, to_cancel)
         
-        if active_jobs_count == 0:
-            print("No active jobs found to stop.")
+            if active_jobs_count == 0:
+                print("No active jobs found to stop.")
+            else:
+                # Only the cancelled jobs changed state; refresh those instead of re-listing everything
+                refreshed = {
+                    j.name: j
+                    for j in _run(_gather_bounded(_refresh_job, client, to_cancel))
+                }
+                jobs = [refreshed.get(j.name, j) for j in jobs]
 
-    except Exception as e:
-        print(f"Error checking jobs: {e}")
+        except Exception as e:
+            print(f"Error checking jobs: {e}")
 
-    # 1.5 Delete Job History (New Feature)
-    print("\n--- Job History Cleanup ---")
-    try:
-        # Re-fetch jobs list (some might have changed state)
-        jobs = list(client.batches.list())
+        # 1.5 Delete Job History (New Feature)
+        print("\n--- Job History Cleanup ---")
+        try:
+            if jobs is None:
+                # Listing failed above; try once more
+                jobs = list(client.batches.list())
         
-        if not jobs:
-            print("No job history found.")
-        else:
-            print(f"Found {len(jobs)} total jobs in history.")
-            action = input("Delete job history? (all/specific/none): ").strip().lower()
+            if not jobs:
+                print("No job history found.")
+            else:
+                print(f"Found {len(jobs)} total jobs in history.")
+                action = input("Delete job history? (all/specific/none): ").strip().lower()
             
-            if action == 'all':
-                confirm_all = input("Are you sure you want to delete ALL job history? This cannot be undone. (y/n): ")
-                if confirm_all.lower() == 'y':
-                    for job in jobs:
-                        print(f"Deleting job record: {job.name} ({job.state})")
-                        try:
-                            client.batches.delete(name=job.name)
-                            print("  > Deleted.")
-                        except Exception as e:
-                            print(f"  > Failed to delete: {e}")
+                if action == 'all':
+                    confirm_all = input("Are you sure you want to delete ALL job history? This cannot be undone. (y/n): ")
+                    if confirm_all.lower() == 'y':
+                        _run_concurrently(_delete_job, client, jobs)
             
-            elif action == 'specific':
-                target_id = input("Enter Job ID or Name to delete (exact match): ").strip()
-                if target_id:
-                    # Try to find exact match or suffix match
-                    matches = []
-                    for j in jobs:
-                        # Check ID match
-                        id_match = (j.name == target_id or j.name.endswith(f"/{target_id}"))
-                        # Check Name match (Exact)
-                        name_match = False
-                        if hasattr(j, 'display_name') and j.display_name:
-                            name_match = (j.display_name == target_id)
+                elif action == 'specific':
+                    target_id = input("Enter Job ID or Name to delete (exact match): ").strip()
+                    if target_id:
+                        # Try to find exact match or suffix match
+                        matches = []
+                        for j in jobs:
+                            # A full resource name ("batches/xyz") identifies exactly one job
+                            if j.name == target_id:
+                                matches = [j]
+                                break
+                            # Check ID match
+                            id_match = j.name.endswith(f"/{target_id}")
+                            # Check Name match (Exact)
+                            display_name = getattr(j, 'display_name', None)
+                            name_match = bool(display_name) and display_name == target_id
                         
-                        if id_match or name_match:
-                            matches.append(j)
-
-                    if matches:
-                        for match in matches:
-                            print(f"Deleting job record: {match.name}")
-                            try:
-                                client.batches.delete(name=match.name)
-                                print("  > Deleted.")
-                            except Exception as e:
-                                print(f"  > Failed to delete: {e}")
-                    else:
-                        print(f"No job found matching '{target_id}'")
-            else:
-                print("Skipping job history deletion.")
+                            if id_match or name_match:
+                                matches.append(j)
 
-    except Exception as e:
-        print(f"Error managing job history: {e}")
+                        if matches:
+                            _run_concurrently(_delete_job, client, matches)
+                        else:
+                            print(f"No job found matching '{target_id}'")
+                else:
+                    print("Skipping job history deletion.")
 
-    print("\n--- Cleaning up stored files ---")
-    # 2. Delete All Files
-    delete_files = input("Delete all uploaded files from storage? (y/n): ").strip().lower()
+        except Exception as e:
+            print(f"Error managing job history: {e}")
+
+        print("\n--- Cleaning up stored files ---")
+        # 2. Delete All Files
+        delete_files = input("Delete all uploaded files from storage? (y/n): ").strip().lower()
     
-    if delete_files == 'y':
-        try:
-            # The list method for files might be paginated, so converting to list gets all
-            files = list(client.files.list())
+        if delete_files == 'y':
+            try:
+                # The list method for files might be paginated, so converting to list gets all
+                files = list(client.files.list())
             
-            if not files:
-                print("No files found to delete.")
-            else:
-                print(f"Found {len(files)} file(s). Deleting...")
-                for f in files:
-                    print(f"Deleting file: {f.name} (Display Name: {f.display_name})")
-                    try:
-                        client.files.delete(name=f.name)
-                        print("  > Deleted.")
-                    except Exception as e:
-                        print(f"  > Failed to delete {f.name}: {e}")
-                        
-        except Exception as e:
-            print(f"Error checking files: {e}")
-    else:
-        print("Skipping file cleanup.")
+                if not files:
+                    print("No files found to delete.")
+                else:
+                    print(f"Found {len(files)} file(s). Deleting...")
+                    # Capture plain names up front so the workers never touch the File objects
+                    targets = [(f.name, f.display_name) for f in files]
+                    _run_concurrently(_delete_file, client, targets)
+
+            except Exception as e:
+                print(f"Error checking files: {e}")
+        else:
+            print("Skipping file cleanup.")
+    finally:
+        # Release pooled connections and the loop so nothing is left unclosed at exit
+        _close_loop(client)
 
 if __name__ == "__main__":
     print("WARNING: This script manages cleanup of Jobs and Files.")
@@ -1,49 +1,137 @@
 import os
+import re
 import json
-import base64
+import binascii
+import contextlib
+import http.client
 import shutil
+import sys
 import tempfile
+import threading
+import time
 import urllib.request
+from collections import deque
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from urllib.error import HTTPError, URLError
 from google import genai
+from google.genai.types import JobState
 from dotenv import load_dotenv
 
+# orjson is optional; it parses the large base64-heavy result lines several times faster
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# requests is optional; when installed, all job downloads share one pooled session
+# (keep-alive) instead of paying a TLS handshake per urlopen
+try:
+    import requests
+    _SESSION = requests.Session()
+except ImportError:
+    _SESSION = None
+
 # Chunk size for streaming download (avoid loading entire file into RAM)
 STREAM_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+DOWNLOAD_RETRIES = 5  # Retries after a failed/interrupted download (resumed with HTTP Range)
+RETRY_BACKOFF_S = 2  # First retry delay in seconds; doubled after each failure
+TMPFS_HEADROOM = 256 * 1024 * 1024  # Free space to leave on tmpfs (GEMINI_TMPFS=1)
+RANGE_SEGMENT_SIZE = 64 * 1024 * 1024  # Bytes per Range request when GEMINI_DOWNLOAD_CONNECTIONS > 1
 PROGRESS_INTERVAL = 200  # Print progress every N images
+JOB_WORKERS = 8  # Completed jobs downloaded/processed at once
+DECODE_WORKERS = os.cpu_count() or 1  # Processes decoding/writing images (shared by all jobs)
+# JSONL lines sent to a decode process per task (amortizes IPC). Lines carry whole
+# base64 images (several MB each), so keep this small to bound memory in flight.
+LINES_PER_TASK = 8
+LINE_QUEUE_SIZE = LINES_PER_TASK  # Downloaded lines waiting for the decode pool, per job
+# Decode tasks submitted but not finished, across all jobs: the pool is shared, so a
+# deeper backlog only holds more multi-MB lines in memory without decoding any faster
+DECODE_TASKS_IN_FLIGHT = DECODE_WORKERS * 2
+
+# Characters dropped from job folder names (keeps alphanumerics, space, '.', '_', '-');
+# must match the sanitization in submit_image_batch.py
+_UNSAFE_NAME_CHARS = re.compile(r"[^\w .-]")
+
+# Extensions that mark a job folder as already downloaded
+_OUTPUT_IMAGE_EXTS = frozenset({'.jpg', '.png', '.jpeg'})
+
+# Present in a job folder while its images are being written; removed once the job
+# completes, so a folder left by a failed run is not mistaken for a finished one
+_INCOMPLETE_MARKER = ".incomplete"
+
+# custom_ids always use "/"; only platforms with another separator need them rewritten
+_NEEDS_SEP_FIX = os.sep != "/"
 
 # Where to find source images for failed items (must match submit_image_batch input_dir)
 INPUT_BASE_DIR = "input_images"
 
-# Marker file to track temp path so we can detect/clean leftover from interrupted runs
+# Marker file to track temp paths (one per line) so we can detect/clean leftovers from interrupted runs
 _TEMP_MARKER = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), ".download_images_temp"
 )
 
+# Temp files currently in use by job workers (mirrored into _TEMP_MARKER)
+_live_temps: set[str] = set()
+_live_temps_lock = threading.Lock()
+# Expected full size of each live temp file placed on tmpfs (guarded by _live_temps_lock)
+_tmpfs_reserved: dict[str, int] = {}
+
+
+def _write_temp_marker() -> None:
+    """Rewrite the marker file from _live_temps (caller holds _live_temps_lock)."""
+    try:
+        if _live_temps:
+            with open(_TEMP_MARKER, "w") as mf:
+                mf.write("\n".join(sorted(_live_temps)))
+        else:
+            os.unlink(_TEMP_MARKER)
+    except OSError:
+        pass
+
+
+def _unregister_temp(path: str) -> None:
+    with _live_temps_lock:
+        _live_temps.discard(path)
+        _tmpfs_reserved.pop(path, None)
+        _write_temp_marker()
+
 
 def _check_clean_previous_temp() -> None:
-    """If a previous run left a temp file (e.g. script was killed), report and remove it."""
+    """If a previous run left temp files (e.g. script was killed), report and remove them."""
     if not os.path.isfile(_TEMP_MARKER):
         return
     try:
         with open(_TEMP_MARKER, "r") as f:
-            prev_path = f.read().strip()
+            prev_paths = [p.strip() for p in f if p.strip()]
     except OSError:
-        prev_path = ""
+        prev_paths = []
     try:
         os.unlink(_TEMP_MARKER)
     except OSError:
         pass
-    if not prev_path:
-        return
-    if os.path.isfile(prev_path):
-        try:
-            os.unlink(prev_path)
-            print(f"Removed leftover temp file from previous run: {prev_path}")
-        except OSError as e:
-            print(f"Could not remove leftover temp file {prev_path}: {e}")
-    else:
-        print("Previous run's temp file was already deleted (clean exit).")
+    for prev_path in prev_paths:
+        if os.path.isfile(prev_path):
+            try:
+                os.unlink(prev_path)
+                print(f"Removed leftover temp file from previous run: {prev_path}")
+            except OSError as e:
+                print(f"Could not remove leftover temp file {prev_path}: {e}")
+        else:
+            print("Previous run's temp file was already deleted (clean exit).")
+
+
+def _log(msg: str) -> None:
+    """Print from worker threads: one write per message so lines from different jobs don't interleave.
+
+    Flushed right away: decode processes otherwise hold their messages in the stdout
+    buffer (when it is a pipe or file) until they exit.
+    """
+    sys.stdout.write(msg + "\n")
+    sys.stdout.flush()
 
 
 # Known finish_reason values (Gemini API) for clearer logs
@@ -59,73 +147,629 @@ FINISH_REASONS = {
 
 def _format_response_reason(response: dict, candidate: dict | None = None) -> str:
     """Build a short reason string from API response/candidate for empty content."""
+    # Batch output is REST JSON (camelCase), so look that spelling up first;
+    # the snake_case fallback is then only reached when the field is absent
     parts = []
     if candidate is not None:
-        fr = candidate.get("finish_reason") or candidate.get("finishReason")
+        fr = candidate.get("finishReason") or candidate.get("finish_reason")
         if fr is not None:
             parts.append(f"finish_reason={FINISH_REASONS.get(fr, fr)}")
-        safety = candidate.get("safety_ratings") or candidate.get("safetyRatings")
+        safety = candidate.get("safetyRatings") or candidate.get("safety_ratings")
         if safety:
             parts.append(f"safety_ratings={safety}")
-    prompt_fb = response.get("prompt_feedback") or response.get("promptFeedback")
+    prompt_fb = response.get("promptFeedback") or response.get("prompt_feedback")
     if prompt_fb:
         parts.append(f"prompt_feedback={prompt_fb}")
     return "; ".join(parts) if parts else "no reason in response"
 
 
+# Output directories already created by this (decode worker) process
+_made_dirs: set[str] = set()
+
+# Regular-file names per input directory, listed once per process; the input tree
+# is not modified while downloading, so entries never go stale
+_input_dir_listing: dict[str, frozenset[str]] = {}
+
+
+def _input_file_exists(path: str) -> bool:
+    """os.path.isfile(path), answered from a cached listing of its parent directory."""
+    parent, name = os.path.split(path)
+    listing = _input_dir_listing.get(parent)
+    if listing is None:
+        try:
+            with os.scandir(parent or ".") as it:
+                listing = frozenset(e.name for e in it if e.is_file())
+        except OSError:
+            listing = frozenset()
+        _input_dir_listing[parent] = listing
+    return name in listing
+
+
+def _local_path(custom_id: str) -> str:
+    """Turn a "/"-separated custom_id into a path for this platform."""
+    return custom_id.replace("/", os.sep) if _NEEDS_SEP_FIX else custom_id
+
+
 def _copy_failed_to_unprocessed(
     custom_id: str, job_output_dir: str, input_base_dir: str
 ) -> None:
     """Copy the source image for a failed item into job_output_dir/unprocessed, preserving path structure."""
     if not custom_id or custom_id.startswith("unknown_"):
         return
-    src_path = os.path.join(
-        input_base_dir, custom_id.replace("/", os.sep)
-    )
-    if not os.path.isfile(src_path):
+    local_id = _local_path(custom_id)
+    src_path = os.path.join(input_base_dir, local_id)
+    if not _input_file_exists(src_path):
         return
     unprocessed_dir = os.path.join(job_output_dir, "unprocessed")
-    dest_path = os.path.join(
-        unprocessed_dir, custom_id.replace("/", os.sep)
-    )
+    dest_path = os.path.join(unprocessed_dir, local_id)
     try:
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        parent = os.path.dirname(dest_path)
+        if parent not in _made_dirs:
+            os.makedirs(parent, exist_ok=True)
+            _made_dirs.add(parent)
+        # copy2 already copies in-kernel where the OS supports it (sendfile / fcopyfile)
         shutil.copy2(src_path, dest_path)
     except OSError:
         pass
 
 
-def _stream_download_to_file(api_key: str, file_name: str, dest_path: str) -> None:
-    """Download file from Gemini API to disk in chunks to avoid OOM on large batches."""
+def _write_all(fd: int, data, offset: int | None = None) -> None:
+    """Write all of data to fd (at offset via os.pwrite, if given) with raw writes.
+
+    A raw write may be partial, so loop over a memoryview, which slices without copying.
+    """
+    view = memoryview(data)
+    while view:
+        if offset is None:
+            written = os.write(fd, view)
+        else:
+            written = os.pwrite(fd, view, offset)
+            offset += written
+        view = view[written:]
+
+
+def _write_results(fd: int, data, offset: int | None = None) -> None:
+    """_write_all for the downloaded results file.
+
+    Local write errors (disk full, permissions) are raised as RuntimeError so the
+    download retry loops, which retry OSError as a network failure, let them through.
+    """
+    try:
+        _write_all(fd, data, offset)
+    except OSError as e:
+        raise RuntimeError(f"Writing the results file failed: {e}") from e
+
+
+def _download_connections() -> int:
+    """Parallel Range connections per job download (GEMINI_DOWNLOAD_CONNECTIONS, default 1)."""
+    try:
+        return max(int(os.getenv("GEMINI_DOWNLOAD_CONNECTIONS", "1")), 1)
+    except ValueError:
+        return 1
+
+
+@contextlib.contextmanager
+def _http_get(url: str, headers: dict):
+    """Stream a GET request; yields (status, headers, iterator of byte chunks). Raises HTTPError on 4xx/5xx."""
+    if _SESSION is None:
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=3600) as resp:
+            yield resp.status, resp.headers, iter(lambda: resp.read(STREAM_CHUNK_SIZE), b"")
+        return
+    with _SESSION.get(url, headers=headers, stream=True, timeout=3600) as resp:
+        if resp.status_code >= 400:
+            raise HTTPError(url, resp.status_code, resp.reason, resp.headers, None)
+        yield resp.status_code, resp.headers, resp.iter_content(STREAM_CHUNK_SIZE)
+
+
+def _fetch_range(url: str, headers: dict, fd: int, start: int, end: int) -> None:
+    """Download bytes start..end (inclusive) into fd at the same offsets, retrying with backoff."""
+    pos = start
+    delay = RETRY_BACKOFF_S
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            with _http_get(url, {**headers, "Range": f"bytes={pos}-{end}"}) as (status, _, chunks):
+                if status != 206:
+                    raise RuntimeError(f"Range request failed with status {status}")
+                for chunk in chunks:
+                    _write_results(fd, chunk, pos)
+                    pos += len(chunk)
+            if pos > end:
+                return
+            error = RuntimeError("Download failed: connection closed early")
+        except HTTPError as e:
+            if e.code != 429 and e.code < 500:
+                raise RuntimeError(f"Download failed: {e.code} {e.reason}") from e
+            error = RuntimeError(f"Download failed: {e.code} {e.reason}")
+        except (URLError, OSError, http.client.HTTPException) as e:
+            error = RuntimeError(f"Download failed: {getattr(e, 'reason', e)}")
+        if attempt == DOWNLOAD_RETRIES:
+            raise error
+        time.sleep(delay)
+        delay *= 2
+
+
+def _ranged_download(
+    url: str, headers: dict, dest_path: str, connections: int, on_chunk=None
+) -> int | None:
+    """Download url into dest_path as RANGE_SEGMENT_SIZE pieces over `connections` parallel requests.
+
+    Segments are handed to on_chunk(chunk, offset) in file order as soon as each one and
+    all before it are on disk, so line processing still overlaps the download.
+    Returns the total size, or None (nothing written) if the server can't serve ranges,
+    in which case the caller should fall back to a single stream.
+    """
+    # Probe with a one-byte range: a 206 confirms range support and its
+    # Content-Range ("bytes 0-0/<total>") gives the size
+    try:
+        with _http_get(url, {**headers, "Range": "bytes=0-0"}) as (status, resp_headers, chunks):
+            if status == 206:
+                # Drain the single byte so the connection can be reused; a 200 would be
+                # the whole file, so that one is just closed
+                for _ in chunks:
+                    pass
+    except (URLError, OSError, http.client.HTTPException):
+        return None
+    content_range = resp_headers.get("Content-Range", "") if status == 206 else ""
+    total = content_range.rpartition("/")[2]
+    if not total.isdigit() or int(total) <= RANGE_SEGMENT_SIZE:
+        return None
+    total = int(total)
+
+    segments = [
+        (start, min(start + RANGE_SEGMENT_SIZE, total) - 1)
+        for start in range(0, total, RANGE_SEGMENT_SIZE)
+    ]
+    _log(f"  Downloading {total / (1024 * 1024):.0f} MiB over {connections} connections...")
+    fd = os.open(dest_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+    executor = ThreadPoolExecutor(max_workers=connections)
+    try:
+        os.ftruncate(fd, total)
+        # map() yields in submission order, i.e. once every earlier segment is complete
+        done = executor.map(lambda seg: _fetch_range(url, headers, fd, *seg), segments)
+        for (start, end), _ in zip(segments, done):
+            if on_chunk is not None:
+                for offset in range(start, end + 1, STREAM_CHUNK_SIZE):
+                    on_chunk(os.pread(fd, min(STREAM_CHUNK_SIZE, end + 1 - offset), offset), offset)
+            _log(f"  ... downloaded {(end + 1) / (1024 * 1024):.0f} MiB")
+    finally:
+        # On failure, drop the segments that have not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
+        os.close(fd)
+    return total
+
+
+def _stream_download_to_file(
+    api_key: str, file_name: str, dest_path: str, on_line=None
+) -> None:
+    """Download file from Gemini API to disk in chunks to avoid OOM on large batches.
+
+    If on_line is given, it is called with each complete line (bytes, without the newline)
+    as soon as it has arrived, so results can be processed while the download continues.
+    Transient failures are retried with backoff, resuming from the bytes already on disk
+    via an HTTP Range request. With GEMINI_DOWNLOAD_CONNECTIONS=N (N > 1) a large file is
+    fetched as parallel Range requests instead, if the server supports them.
+    """
     name = file_name if file_name.startswith("files/") else f"files/{file_name}"
     path = f"{name}:download"
     url = f"https://generativelanguage.googleapis.com/v1beta/{path}?alt=media"
-    req = urllib.request.Request(url, headers={"x-goog-api-key": api_key})
+
+    progress_interval_mb = 25  # Print every 25 MiB (more frequent feedback)
+    next_report_mb = progress_interval_mb
+    total_bytes = 0
+    partial = bytearray()  # Bytes after the last newline seen so far
+    fed = 0  # Bytes of the file already passed to the line splitter
+
+    def _feed(chunk: bytes, offset: int) -> None:
+        """Split chunk (starting at file offset) into lines, skipping bytes already fed."""
+        nonlocal fed
+        skip = fed - offset
+        if skip >= len(chunk):
+            return
+        partial.extend(chunk[skip:] if skip > 0 else chunk)
+        fed = offset + len(chunk)
+        end = partial.rfind(b"\n")
+        if end >= 0:
+            for line in bytes(partial[:end]).split(b"\n"):
+                on_line(line)
+            del partial[: end + 1]
+
+    connections = _download_connections()
+    if connections > 1 and hasattr(os, "pwrite"):
+        headers = {"x-goog-api-key": api_key, "Accept-Encoding": "identity"}
+        total_bytes = _ranged_download(
+            url, headers, dest_path, connections, _feed if on_line is not None else None
+        )
+        if total_bytes is not None:
+            if on_line is not None and partial:
+                on_line(bytes(partial))
+            return
+
+    _log("  Streaming to disk (this may take several minutes for large batches)...")
+    delay = RETRY_BACKOFF_S
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        existing = os.path.getsize(dest_path) if os.path.exists(dest_path) else 0
+        # identity encoding: Range offsets must refer to the bytes we store
+        headers = {"x-goog-api-key": api_key, "Accept-Encoding": "identity"}
+        if existing:
+            headers["Range"] = f"bytes={existing}-"
+        try:
+            with _http_get(url, headers) as (status, _, chunks):
+                if status == 206:
+                    flags, total_bytes = os.O_APPEND, existing
+                elif status == 200:
+                    # No Range sent, or the server ignored it: (re)start from byte 0
+                    flags, total_bytes = os.O_TRUNC, 0
+                else:
+                    raise RuntimeError(f"Download failed with status {status}")
+                if existing and status == 206:
+                    _log(f"  Resuming at {existing / (1024 * 1024):.1f} MiB")
+                elif existing:
+                    _log("  Server ignored the Range request; restarting from the beginning")
+                try:
+                    fd = os.open(
+                        dest_path,
+                        os.O_WRONLY | os.O_CREAT | flags | getattr(os, "O_BINARY", 0),
+                        0o666,
+                    )
+                except OSError as e:
+                    raise RuntimeError(f"Cannot open the results file: {e}") from e
+                try:
+                    for chunk in chunks:
+                        _write_results(fd, chunk)
+                        if on_line is not None:
+                            _feed(chunk, total_bytes)
+                        total_bytes += len(chunk)
+                        total_mb = total_bytes / (1024 * 1024)
+                        if total_mb >= next_report_mb:
+                            _log(f"  ... downloaded {total_mb:.0f} MiB")
+                            next_report_mb += progress_interval_mb
+                finally:
+                    os.close(fd)
+            break
+        except HTTPError as e:
+            if e.code == 416 and existing:
+                # Range starts at the end of the file: everything is already on disk
+                total_bytes = existing
+                break
+            if e.code != 429 and e.code < 500:
+                raise RuntimeError(f"Download failed: {e.code} {e.reason}") from e
+            error = RuntimeError(f"Download failed: {e.code} {e.reason}")
+        # requests' exceptions derive from OSError, so this covers both transports
+        # (_write_results turns local write errors into RuntimeError, so those aren't retried)
+        except (URLError, OSError, http.client.HTTPException) as e:
+            error = RuntimeError(f"Download failed: {getattr(e, 'reason', e)}")
+        if attempt == DOWNLOAD_RETRIES:
+            raise error
+        _log(f"  {error}; retrying in {delay}s ({attempt + 1}/{DOWNLOAD_RETRIES})...")
+        time.sleep(delay)
+        delay *= 2
+
+    if on_line is not None and partial:
+        on_line(bytes(partial))
+    if total_bytes > 0 and (total_bytes / (1024 * 1024)) < progress_interval_mb:
+        _log(f"  ... downloaded {total_bytes / (1024 * 1024):.1f} MiB")
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    """Write data to path with raw os.write calls (no buffered-IO copy)."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
     try:
-        print("  Streaming to disk (this may take several minutes for large batches)...")
-        with urllib.request.urlopen(req, timeout=3600) as resp:
-            if resp.status != 200:
-                raise RuntimeError(f"Download failed with status {resp.status}")
-            total_bytes = 0
-            progress_interval_mb = 25  # Print every 25 MiB (more frequent feedback)
-            next_report_mb = progress_interval_mb
-            with open(dest_path, "wb") as f:
-                while True:
-                    chunk = resp.read(STREAM_CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    total_bytes += len(chunk)
-                    total_mb = total_bytes / (1024 * 1024)
-                    if total_mb >= next_report_mb:
-                        print(f"  ... downloaded {total_mb:.0f} MiB")
-                        next_report_mb += progress_interval_mb
-            if total_bytes > 0 and (total_bytes / (1024 * 1024)) < progress_interval_mb:
-                print(f"  ... downloaded {total_bytes / (1024 * 1024):.1f} MiB")
-    except HTTPError as e:
-        raise RuntimeError(f"Download failed: {e.code} {e.reason}") from e
-    except URLError as e:
-        raise RuntimeError(f"Download failed: {e.reason}") from e
+        _write_all(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _process_line(
+    line_num: int, line: bytes, job_output_dir: str, input_base_dir: str
+) -> list[str]:
+    """Parse one JSONL result line and save its image(s). Returns the saved paths."""
+    # Both parsers take raw UTF-8 bytes and skip surrounding whitespace themselves,
+    # so don't strip (that would copy a multi-MB line); isspace() stops at the first "{"
+    if not line or line.isspace():
+        return []
+    saved = []
+    custom_id = f"unknown_{line_num}"
+    try:
+        item = _json_loads(line)
+        custom_id = item.get("custom_id", custom_id)
+
+        # Check for error in individual request
+        if "error" in item:
+            _log(f"  Error for {custom_id}: {item['error']['message']}")
+            _copy_failed_to_unprocessed(custom_id, job_output_dir, input_base_dir)
+            return saved
+
+        # Extract image
+        response = item.get("response", {})
+        candidates = response.get("candidates", [])
+
+        if not candidates:
+            reason = _format_response_reason(response, None)
+            _log(f"  No candidates returned for {custom_id} ({reason})")
+            _copy_failed_to_unprocessed(custom_id, job_output_dir, input_base_dir)
+            return saved
+
+        # Output names only depend on the candidate index, so split the ID once
+        if len(candidates) > 1:
+            stem, ext = os.path.splitext(_local_path(custom_id))
+
+        # Loop through all candidates
+        any_parts = False
+        for i, candidate in enumerate(candidates):
+            parts = candidate.get("content", {}).get("parts", [])
+            if not parts:
+                continue
+            any_parts = True
+
+            img_data_b64 = None
+            for part in parts:
+                if "inline_data" in part:
+                    img_data_b64 = part["inline_data"]["data"]
+                    break
+                elif "inlineData" in part:
+                    img_data_b64 = part["inlineData"]["data"]
+                    break
+
+            if img_data_b64:
+                if len(candidates) > 1:
+                    local_filename = f"{stem}_c{i+1}{ext}"
+                else:
+                    local_filename = _local_path(custom_id)
+
+                # a2b_base64 skips the b64decode wrapper (same lenient decoding)
+                img_bytes = binascii.a2b_base64(img_data_b64)
+
+                save_path = os.path.join(job_output_dir, local_filename)
+
+                parent = os.path.dirname(save_path)
+                if parent and parent not in _made_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    _made_dirs.add(parent)
+
+                _write_bytes(save_path, img_bytes)
+                saved.append(save_path)
+            else:
+                reason = _format_response_reason(response, candidate)
+                _log(
+                    f"  No image found in candidate {i+1} for {custom_id} ({reason})"
+                )
+                _copy_failed_to_unprocessed(custom_id, job_output_dir, input_base_dir)
+
+        if not any_parts:
+            reason = _format_response_reason(response, candidates[0])
+            _log(f"  No content parts for {custom_id} ({reason})")
+            _copy_failed_to_unprocessed(custom_id, job_output_dir, input_base_dir)
+    except json.JSONDecodeError:
+        _log("  Failed to parse JSON line.")
+    except Exception as e:
+        _log(f"  Error processing item {custom_id}: {e}")
+    return saved
+
+
+def _process_line_batch(
+    batch: list[tuple[int, bytes]], job_output_dir: str, input_base_dir: str
+) -> list[str]:
+    """Decode-pool task: process a chunk of (line_num, line) pairs. Returns all saved paths."""
+    saved = []
+    for line_num, line in batch:
+        saved.extend(_process_line(line_num, line, job_output_dir, input_base_dir))
+    return saved
+
+
+def _map_bounded(executor, fn, iterable, window: int, slots=None):
+    """Like executor.map, but keeps at most `window` tasks queued so a huge input is never loaded at once.
+
+    If slots (a semaphore shared with other callers) is given, each task also holds one
+    slot from submission until it finishes, which bounds the tasks in flight across callers.
+    """
+    pending = deque()
+    for args in iterable:
+        if slots is None:
+            future = executor.submit(fn, *args)
+        else:
+            slots.acquire()
+            try:
+                future = executor.submit(fn, *args)
+            except BaseException:
+                slots.release()
+                raise
+            future.add_done_callback(lambda _: slots.release())
+        pending.append(future)
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# Shared by the consumer threads of all jobs (see DECODE_TASKS_IN_FLIGHT)
+_decode_slots = threading.BoundedSemaphore(DECODE_TASKS_IN_FLIGHT)
+
+
+def _decode_from_queue(
+    line_queue: queue.Queue, job_output_dir: str, decode_pool, result: dict
+) -> None:
+    """Consumer thread: feed lines from line_queue (None ends it) to decode_pool in batches.
+
+    Stores the number of saved images in result["saved"]. On error it keeps draining the
+    queue so the downloading thread never blocks on a full queue.
+    """
+    def _lines():
+        while True:
+            line = line_queue.get()
+            if line is None:
+                return
+            yield line
+
+    numbered = enumerate(_lines())
+    tasks = (
+        (batch, job_output_dir, INPUT_BASE_DIR)
+        for batch in iter(lambda: list(islice(numbered, LINES_PER_TASK)), [])
+    )
+    saved_count = 0
+    try:
+        for saved in _map_bounded(
+            decode_pool, _process_line_batch, tasks, DECODE_TASKS_IN_FLIGHT, _decode_slots
+        ):
+            for save_path in saved:
+                saved_count += 1
+                if saved_count <= 10 or saved_count % PROGRESS_INTERVAL == 0:
+                    _log(f"  Saved {saved_count}: {save_path}")
+    except Exception as e:
+        result["error"] = e
+        for _ in numbered:
+            pass
+    result["saved"] = saved_count
+
+
+def _tmpfs_dir() -> str | None:
+    """Return a RAM-backed dir for result temp files if GEMINI_TMPFS=1, else None."""
+    if os.getenv("GEMINI_TMPFS") != "1":
+        return None
+    for candidate in ("/dev/shm", os.getenv("XDG_RUNTIME_DIR")):
+        if candidate and os.path.isdir(candidate):
+            return candidate
+    return None
+
+
+def _create_results_temp(client, file_name: str) -> str:
+    """Create and register the temp file for a job's results; returns its path.
+
+    With GEMINI_TMPFS=1 it goes on tmpfs, but only if there is room for the whole result
+    file (size from the Files API) on top of what the other live tmpfs temp files will
+    still grow by, since running out of RAM is worse than a disk write.
+    """
+    tmpfs = _tmpfs_dir()
+    expected_size = 0
+    if tmpfs is not None:
+        try:
+            expected_size = client.files.get(name=file_name).size_bytes or 0
+        except Exception:
+            tmpfs = None
+
+    # Check and reserve under the lock so concurrent jobs can't all claim the same free space
+    with _live_temps_lock:
+        temp_dir = None
+        if tmpfs is not None:
+            still_to_write = 0
+            for path, size in _tmpfs_reserved.items():
+                try:
+                    still_to_write += max(size - os.path.getsize(path), 0)
+                except OSError:
+                    pass
+            try:
+                free = shutil.disk_usage(tmpfs).free - still_to_write
+                if free > expected_size + TMPFS_HEADROOM:
+                    temp_dir = tmpfs
+            except OSError:
+                pass
+        with tempfile.NamedTemporaryFile(
+            mode="wb", suffix=".jsonl", delete=False, dir=temp_dir
+        ) as tmp:
+            tmp_path = tmp.name
+        if temp_dir is not None:
+            _tmpfs_reserved[tmp_path] = expected_size
+        _live_temps.add(tmp_path)
+        _write_temp_marker()
+    return tmp_path
+
+
+def _process_job(client, api_key: str, job, base_output_dir: str, decode_pool) -> None:
+    """Download one completed job's results and save its images using decode_pool."""
+    display_name = getattr(job, 'display_name', None)
+    header = f"\nJob: {job.name}"
+    if display_name:
+        header += f"\nName: {display_name}"
+    _log(header)
+    
+    # Determine folder name
+    # Prefer display name if available, otherwise ID
+    if display_name and not display_name.startswith("image_enhance_"):
+         # Use user-provided name (sanitize it)
+         folder_name = display_name
+    else:
+         # Use ID for auto-generated names or missing names
+         folder_name = job.name.split('/')[-1]
+    
+    # Sanitize folder name
+    folder_name = _UNSAFE_NAME_CHARS.sub("", folder_name).strip().replace(' ', '_')
+    
+    job_output_dir = os.path.join(base_output_dir, f"job_{folder_name}")
+    
+    # Check if this job has already been processed (folder exists and has images)
+    marker_path = os.path.join(job_output_dir, _INCOMPLETE_MARKER)
+    if os.path.exists(marker_path):
+        _log(f"  Previous download of {job.name} did not finish; downloading it again.")
+    elif os.path.exists(job_output_dir):
+        # Simple check: if there are image files in it, we assume it's done.
+        # any() over scandir stops at the first image instead of listing the whole folder
+        # (the with-block closes the directory handle even when any() stops early)
+        with os.scandir(job_output_dir) as it:
+            has_images = any(
+                e.is_file() and os.path.splitext(e.name)[1].lower() in _OUTPUT_IMAGE_EXTS
+                for e in it
+            )
+        if has_images:
+            _log(f"  Skipping {job.name}: Output folder already exists with images.")
+            return
+    
+    # If directory exists and has images, we might want to skip or check
+    # For now, we will process it to ensure we have the files.
+    os.makedirs(job_output_dir, exist_ok=True)
+    
+    if not job.dest or not job.dest.file_name:
+        _log(f"  No output file found for {job.name}.")
+        return
+
+    _log(f"  Downloading results: {job.dest.file_name}")
+    tmp_path = None
+    try:
+        # Stream download to temp file to avoid OOM on large batches (e.g. 4000+ images)
+        tmp_path = _create_results_temp(client, job.dest.file_name)
+
+        # Written before the first image; only removed once every line was processed
+        with open(marker_path, "w"):
+            pass
+
+        # Decode lines while the download is still running: a consumer thread batches
+        # completed lines into the process pool (base64 decode + write is CPU-bound).
+        # The temp file is still written so a failed download can be resumed.
+        line_queue = queue.Queue(maxsize=LINE_QUEUE_SIZE)
+        result = {}
+        consumer = threading.Thread(
+            target=_decode_from_queue,
+            args=(line_queue, job_output_dir, decode_pool, result),
+            daemon=True,
+        )
+        consumer.start()
+        try:
+            _stream_download_to_file(
+                api_key, job.dest.file_name, tmp_path, on_line=line_queue.put
+            )
+        except Exception:
+            _log(
+                f"  Download of {job.name} failed; images already decoded were kept "
+                f"and the job will be downloaded again on the next run."
+            )
+            raise
+        finally:
+            line_queue.put(None)
+            consumer.join()
+        if "error" in result:
+            raise result["error"]
+
+        os.unlink(marker_path)
+        _log(f"  Done with {job.name}. Total images saved: {result['saved']}")
+
+    except Exception as e:
+        _log(f"  Error downloading/processing file for {job.name}: {e}")
+    finally:
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            _unregister_temp(tmp_path)
 
 
 def download_images():
@@ -139,25 +783,33 @@ def download_images():
 
     _check_clean_previous_temp()
 
+    if _SESSION is not None:
+        # Size the session's pool for every download thread (jobs x range connections);
+        # the default adapter keeps only 10 and discards connections beyond that
+        pool_size = JOB_WORKERS * _download_connections()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+        _SESSION.mount("https://", adapter)
+        _SESSION.mount("http://", adapter)
+
+    # User Filter (asked first so a specific job can stop the listing early)
+    target_input = input("Enter specific Job ID or Name to download (or press Enter to scan all): ").strip()
+
     print("Checking for completed batch jobs...")
     try:
-        jobs = list(client.batches.list())
-        
-        # User Filter
-        target_input = input("Enter specific Job ID or Name to download (or press Enter to scan all): ").strip()
+        # Pager: fetches further pages only as the loop below asks for them
+        jobs = client.batches.list()
         
         if target_input:
             # Filter matches (support both full name "batches/xyz", short id "xyz", and display name)
             filtered_jobs = []
             for j in jobs:
-                # Check ID match
-                id_match = (j.name == target_input or j.name.endswith(f"/{target_input}"))
-                # Check Display Name match (EXACT match only)
-                name_match = False
-                if hasattr(j, 'display_name') and j.display_name:
-                    name_match = (target_input == j.display_name)
-                
-                if (id_match or name_match) and j.state == "JOB_STATE_SUCCEEDED":
+                # A job ID (full "batches/xyz" or short "xyz") identifies exactly one job
+                if j.name == target_input or j.name.endswith(f"/{target_input}"):
+                    filtered_jobs = [j] if j.state == JobState.JOB_STATE_SUCCEEDED else []
+                    break
+                # Check Display Name match (EXACT match only); names may repeat, keep scanning
+                display_name = getattr(j, 'display_name', None)
+                if display_name and target_input == display_name and j.state == JobState.JOB_STATE_SUCCEEDED:
                     filtered_jobs.append(j)
             
             completed_jobs = filtered_jobs
@@ -166,7 +818,7 @@ def download_images():
                  print(f"No completed job found matching '{target_input}'")
                  return
         else:
-            completed_jobs = [j for j in jobs if j.state == "JOB_STATE_SUCCEEDED"]
+            completed_jobs = [j for j in jobs if j.state == JobState.JOB_STATE_SUCCEEDED]
         
         if not completed_jobs:
             print("No completed batch jobs found.")
@@ -174,209 +826,23 @@ def download_images():
 
         print(f"Found {len(completed_jobs)} completed job(s). Processing...")
 
-        for job in completed_jobs:
-            print(f"\nJob: {job.name}")
-            if hasattr(job, 'display_name') and job.display_name:
-                print(f"Name: {job.display_name}")
-            
-            # Determine folder name
-            # Prefer display name if available, otherwise ID
-            if hasattr(job, 'display_name') and job.display_name and not job.display_name.startswith("image_enhance_"):
-                 # Use user-provided name (sanitize it)
-                 folder_name = job.display_name
-            else:
-                 # Use ID for auto-generated names or missing names
-                 folder_name = job.name.split('/')[-1]
-            
-            # Sanitize folder name
-            folder_name = "".join(c for c in folder_name if c.isalnum() or c in (' ', '.', '_', '-')).strip().replace(' ', '_')
-            
-            job_output_dir = os.path.join(base_output_dir, f"job_{folder_name}")
-            
-            # Check if this job has already been processed (folder exists and has images)
-            if os.path.exists(job_output_dir):
-                # Simple check: if there are image files in it, we assume it's done.
-                existing_files = [f for f in os.listdir(job_output_dir) if f.lower().endswith(('.jpg', '.png', '.jpeg'))]
-                if existing_files:
-                    print(f"  Skipping: Output folder already exists with {len(existing_files)} images.")
-                    continue
-            
-            # If directory exists and has images, we might want to skip or check
-            # For now, we will process it to ensure we have the files.
-            os.makedirs(job_output_dir, exist_ok=True)
-            
-            if not job.dest or not job.dest.file_name:
-                print("  No output file found.")
-                continue
-
-            print(f"  Downloading results: {job.dest.file_name}")
-            tmp_path = None
-            try:
-                # Stream download to temp file to avoid OOM on large batches (e.g. 4000+ images)
-                with tempfile.NamedTemporaryFile(
-                    mode="wb", suffix=".jsonl", delete=False
-                ) as tmp:
-                    tmp_path = tmp.name
-                try:
-                    with open(_TEMP_MARKER, "w") as mf:
-                        mf.write(tmp_path)
-                    _stream_download_to_file(
-                        api_key, job.dest.file_name, tmp_path
-                    )
-                except Exception as e:
-                    try:
-                        os.unlink(tmp_path)
-                    except OSError:
-                        pass
-                    try:
-                        os.unlink(_TEMP_MARKER)
-                    except OSError:
-                        pass
-                    raise e
-
-                saved_count = 0
-                # Process JSONL line by line so we never load the whole file into memory
-                with open(tmp_path, "r", encoding="utf-8") as f:
-                    for line_num, line in enumerate(f):
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            item = json.loads(line)
-                            custom_id = item.get(
-                                "custom_id", f"unknown_{line_num}"
-                            )
-
-                            # Check for error in individual request
-                            if "error" in item:
-                                print(
-                                    f"  Error for {custom_id}: {item['error']['message']}"
-                                )
-                                _copy_failed_to_unprocessed(
-                                    custom_id, job_output_dir, INPUT_BASE_DIR
-                                )
-                                continue
-
-                            # Extract image
-                            response = item.get("response", {})
-                            candidates = response.get("candidates", [])
-
-                            if not candidates:
-                                reason = _format_response_reason(response, None)
-                                print(
-                                    f"  No candidates returned for {custom_id} ({reason})"
-                                )
-                                _copy_failed_to_unprocessed(
-                                    custom_id, job_output_dir, INPUT_BASE_DIR
-                                )
-                                continue
-
-                            parts = (
-                                candidates[0]
-                                .get("content", {})
-                                .get("parts", [])
-                            )
-                            if not parts:
-                                reason = _format_response_reason(
-                                    response, candidates[0]
-                                )
-                                print(
-                                    f"  No content parts for {custom_id} ({reason})"
-                                )
-                                _copy_failed_to_unprocessed(
-                                    custom_id, job_output_dir, INPUT_BASE_DIR
-                                )
-                                continue
-
-                            # Loop through all candidates
-                            for i, candidate in enumerate(candidates):
-                                parts = (
-                                    candidate.get("content", {})
-                                    .get("parts", [])
-                                )
-                                if not parts:
-                                    continue
-
-                                img_data_b64 = None
-                                for part in parts:
-                                    if "inline_data" in part:
-                                        img_data_b64 = part["inline_data"][
-                                            "data"
-                                        ]
-                                        break
-                                    elif "inlineData" in part:
-                                        img_data_b64 = part["inlineData"][
-                                            "data"
-                                        ]
-                                        break
-
-                                if img_data_b64:
-                                    if len(candidates) > 1:
-                                        name_parts = os.path.splitext(
-                                            custom_id
-                                        )
-                                        final_filename = (
-                                            f"{name_parts[0]}_c{i+1}{name_parts[1]}"
-                                        )
-                                    else:
-                                        final_filename = custom_id
-
-                                    img_bytes = base64.b64decode(img_data_b64)
-
-                                    local_filename = final_filename.replace(
-                                        "/", os.sep
-                                    )
-                                    save_path = os.path.join(
-                                        job_output_dir, local_filename
-                                    )
-
-                                    parent = os.path.dirname(save_path)
-                                    if parent:
-                                        os.makedirs(parent, exist_ok=True)
-
-                                    with open(save_path, "wb") as img_f:
-                                        img_f.write(img_bytes)
-                                    saved_count += 1
-                                    if saved_count <= 10 or saved_count % PROGRESS_INTERVAL == 0:
-                                        print(
-                                            f"  Saved {saved_count}: {save_path}"
-                                        )
-                                else:
-                                    reason = _format_response_reason(
-                                        response, candidate
-                                    )
-                                    print(
-                                        f"  No image found in candidate {i+1} for {custom_id} ({reason})"
-                                    )
-                                    _copy_failed_to_unprocessed(
-                                        custom_id, job_output_dir, INPUT_BASE_DIR
-                                    )
-                        except json.JSONDecodeError:
-                            print("  Failed to parse JSON line.")
-                        except Exception as e:
-                            print(
-                                f"  Error processing item {custom_id}: {e}"
-                            )
-
-                os.unlink(tmp_path)
-                try:
-                    os.unlink(_TEMP_MARKER)
-                except OSError:
-                    pass
-                print(f"  Done. Total images saved: {saved_count}")
-
-            except Exception as e:
-                print(f"  Error downloading/processing file: {e}")
-            finally:
-                if tmp_path is not None:
-                    try:
-                        os.unlink(tmp_path)
-                    except OSError:
-                        pass
-                try:
-                    os.unlink(_TEMP_MARKER)
-                except OSError:
-                    pass
+        # Jobs are independent (own output folder and temp file), so download them in
+        # parallel; all jobs share one decode process pool. "spawn" because forking a
+        # process that is already running download threads is unsafe.
+        with ProcessPoolExecutor(
+            max_workers=DECODE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as decode_pool, ThreadPoolExecutor(
+            max_workers=min(JOB_WORKERS, len(completed_jobs))
+        ) as executor:
+            list(
+                executor.map(
+                    lambda job: _process_job(
+                        client, api_key, job, base_output_dir, decode_pool
+                    ),
+                    completed_jobs,
+                )
+            )
 
     except Exception as e:
         print(f"An error occurred: {e}")
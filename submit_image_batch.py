@@ -1,20 +1,39 @@
 import os
+import re
 import json
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 
-def upload_single_file(client, file_path):
-    """Helper function to upload a single file."""
+# orjson is optional; it encodes the batch request lines several times faster
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
+# Characters dropped from job folder names (keeps alphanumerics, space, '.', '_', '-');
+# must match the sanitization in download_images.py
+_UNSAFE_NAME_CHARS = re.compile(r"[^\w .-]")
+
+# Input image extensions picked up from input_dir (compared lower-cased)
+_IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+
+# Uploads kept in flight at once (each one mostly waits on the network / processing poll)
+MAX_CONCURRENT_UPLOADS = 64
+
+async def upload_single_file(client, file_path):
+    """Helper coroutine to upload a single file."""
     try:
-        file_obj = client.files.upload(file=file_path)
+        file_obj = await client.aio.files.upload(file=file_path)
         
-        # Wait for processing
+        # Wait for processing (without holding a thread while idle)
         while file_obj.state.name == "PROCESSING":
-            time.sleep(1)
-            file_obj = client.files.get(name=file_obj.name)
+            await asyncio.sleep(1)
+            file_obj = await client.aio.files.get(name=file_obj.name)
             
         if file_obj.state.name != "ACTIVE":
             return None, f"Failed state: {file_obj.state.name}"
@@ -23,6 +42,39 @@ def upload_single_file(client, file_path):
     except Exception as e:
         return None, str(e)
 
+async def _upload_all(client, image_files):
+    """Upload all (full_path, rel_path) pairs concurrently. Returns {rel_path: file_obj}."""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+    async def _upload(full_path, rel_path):
+        async with sem:
+            return rel_path, await upload_single_file(client, full_path)
+
+    uploaded_files = {}
+    completed_count = 0
+    total_count = len(image_files)
+    
+    try:
+        # Process results as they complete
+        for next_done in asyncio.as_completed(
+            [_upload(full_path, rel_path) for full_path, rel_path in image_files]
+        ):
+            rel_path, (file_obj, error) = await next_done
+            completed_count += 1
+            if file_obj:
+                uploaded_files[rel_path] = file_obj
+                print(f"[{completed_count}/{total_count}] Ready: {rel_path}")
+            else:
+                print(f"[{completed_count}/{total_count}] Failed {rel_path}: {error}")
+    finally:
+        # Close the async transport before asyncio.run() tears down this loop
+        # (only newer SDK versions have aclose)
+        aclose = getattr(client.aio, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    return uploaded_files
+
 def submit_batch():
     load_dotenv()
     api_key = os.getenv("GEMINI_API_KEY")
@@ -43,10 +95,9 @@ def submit_batch():
         return
 
     # Ask which parent folder inside input_images (or all) — first so we know scope before other options
-    subdirs = sorted(
-        d for d in os.listdir(input_dir)
-        if os.path.isdir(os.path.join(input_dir, d))
-    )
+    # scandir entries carry their file type, so no extra stat per entry
+    with os.scandir(input_dir) as it:
+        subdirs = sorted(e.name for e in it if e.is_dir())
     if subdirs:
         print(f"Parent folders in '{input_dir}': all | " + " | ".join(subdirs))
     parent_choice = input(
@@ -108,7 +159,7 @@ def submit_batch():
     # Walk from scan_root; keep rel_path relative to input_dir for consistent IDs
     for root, dirs, files in os.walk(scan_root):
         for file in files:
-            if file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            if os.path.splitext(file)[1].lower() in _IMAGE_EXTS:
                 full_path = os.path.join(root, file)
                 # Create relative path for ID (e.g. "subfolder/image.jpg")
                 rel_path = os.path.relpath(full_path, input_dir)
@@ -120,36 +171,10 @@ def submit_batch():
         print("No images found.")
         return
 
-    uploaded_files = {}
-    print(f"Found {len(image_files)} images. Uploading (Concurrent: 10 threads)...")
+    print(f"Found {len(image_files)} images. Uploading (Concurrent: up to {MAX_CONCURRENT_UPLOADS})...")
     
-    # Use ThreadPoolExecutor for concurrent uploads
-    max_workers = 10
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all upload tasks
-        # Map future to the relative path (ID)
-        future_to_file = {
-            executor.submit(upload_single_file, client, full_path): rel_path 
-            for full_path, rel_path in image_files
-        }
-        
-        # Process results as they complete
-        completed_count = 0
-        total_count = len(image_files)
-        
-        for future in as_completed(future_to_file):
-            rel_path = future_to_file[future]
-            completed_count += 1
-            
-            try:
-                file_obj, error = future.result()
-                if file_obj:
-                    uploaded_files[rel_path] = file_obj
-                    print(f"[{completed_count}/{total_count}] Ready: {rel_path}")
-                else:
-                    print(f"[{completed_count}/{total_count}] Failed {rel_path}: {error}")
-            except Exception as e:
-                print(f"[{completed_count}/{total_count}] Error {rel_path}: {e}")
+    # Uploads run as coroutines on one event loop via the SDK's async client
+    uploaded_files = asyncio.run(_upload_all(client, image_files))
 
     if not uploaded_files:
         print("No files were successfully uploaded. Aborting.")
@@ -157,38 +182,37 @@ def submit_batch():
 
     # 2. Prepare Batch Request
     print("\nPreparing batch request...")
-    batch_requests = []
+    jsonl_filename = "batch_input_images.jsonl"
+    request_count = 0
     
     # Prompt text is defined above
     
-    for img_name, file_obj in uploaded_files.items():
-        # Construct the request for this item
-        request = {
-            "custom_id": img_name, # Use filename as ID to track results
-            "request": {
-                "model": model_id_full,
-                "contents": [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt_text},
-                            {"file_data": {"file_uri": file_obj.uri, "mime_type": file_obj.mime_type}}
-                        ]
-                    }
-                ],
-                "generation_config": generation_config
+    # Each request is written as soon as it is built instead of collecting them all first
+    with open(jsonl_filename, "wb") as f:
+        for img_name, file_obj in uploaded_files.items():
+            # Construct the request for this item
+            request = {
+                "custom_id": img_name, # Use filename as ID to track results
+                "request": {
+                    "model": model_id_full,
+                    "contents": [
+                        {
+                            "role": "user",
+                            "parts": [
+                                {"text": prompt_text},
+                                {"file_data": {"file_uri": file_obj.uri, "mime_type": file_obj.mime_type}}
+                            ]
+                        }
+                    ],
+                    "generation_config": generation_config
+                }
             }
-        }
-        
-        batch_requests.append(request)
-
-    # Write JSONL file
-    jsonl_filename = "batch_input_images.jsonl"
-    with open(jsonl_filename, "w") as f:
-        for req in batch_requests:
-            f.write(json.dumps(req) + "\n")
             
-    print(f"Created {jsonl_filename} with {len(batch_requests)} requests.")
+            f.write(_json_dumps(request))
+            f.write(b"\n")
+            request_count += 1
+            
+    print(f"Created {jsonl_filename} with {request_count} requests.")
 
     # 3. Upload JSONL and Create Job
     print("Uploading batch input file...")
@@ -226,7 +250,7 @@ def submit_batch():
         # Use display name if available, otherwise use ID
         folder_name = job_display_name if user_job_name else job.name.split('/')[-1]
         # Clean up name for filesystem (simple sanitization)
-        folder_name = "".join(c for c in folder_name if c.isalnum() or c in (' ', '.', '_', '-')).strip().replace(' ', '_')
+        folder_name = _UNSAFE_NAME_CHARS.sub("", folder_name).strip().replace(' ', '_')
         
         job_dir = f"generated_images/job_{folder_name}"
         os.makedirs(job_dir, exist_ok=True)